@@ -1,17 +1,60 @@
+import asyncio
+import json
 import logging
+import mmap
 import os
+import pickle
+import random
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
-from typing import Dict, List
+from dataclasses import replace
+from typing import (
+    Any,
+    Awaitable,
+    BinaryIO,
+    Callable,
+    Coroutine,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 import jsonpickle
 import numpy as np
 import openai
 
+from automata.core.search.symbol_parser import parse_symbol
 from automata.core.search.symbol_types import StrPath, Symbol, SymbolEmbedding
 from automata.core.search.symbol_utils import get_rankable_symbols
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Embedding requests are retried with random exponential backoff on rate limits and transient
+# errors only, while e.g. an invalid (4xx) request fails at once
+EMBEDDING_REQUEST_ATTEMPTS = 6
+EMBEDDING_RETRY_MAX_WAIT = 20.0
+_RETRYABLE_EMBEDDING_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.APIError,
+    openai.error.Timeout,
+)
+
+try:
+    import orjson
+
+    _USE_ORJSON = True
+except ImportError:
+    _USE_ORJSON = False
+
 
 class EmbeddingsProvider:
     def __init__(self):
@@ -19,6 +62,10 @@ class EmbeddingsProvider:
             from automata.config import OPENAI_API_KEY
 
             openai.api_key = OPENAI_API_KEY
+        # The openai embedding functions are bound on first use rather than at import time,
+        # to allow easy mocking of them in tests, and are then reused on every later call
+        self._get_embedding_impl: Optional[Callable[..., List[float]]] = None
+        self._acreate_embedding_impl: Optional[Callable[..., Awaitable[Any]]] = None
 
     def get_embedding(self, symbol_source: str) -> np.ndarray:
         """
@@ -28,10 +75,54 @@ class EmbeddingsProvider:
         Returns:
             A numpy array representing the embedding
         """
-        # wait to import get_embedding to allow easy mocking of the function in tests.
-        from openai.embeddings_utils import get_embedding
+        if self._get_embedding_impl is None:
+            from openai.embeddings_utils import get_embedding
+
+            self._get_embedding_impl = get_embedding
 
-        return np.array(get_embedding(symbol_source, engine="text-embedding-ada-002"))
+        return np.asarray(
+            self._get_embedding_impl(symbol_source, engine="text-embedding-ada-002"),
+            dtype=np.float32,
+        )
+
+    async def aget_embedding(self, symbol_source: str) -> np.ndarray:
+        """
+        Asynchronously get the embedding for a symbol.
+        Args:
+            symbol_source (str): The source code of the symbol
+        Returns:
+            A numpy array representing the embedding
+        """
+        return (await self.aget_embeddings([symbol_source]))[0]
+
+    async def aget_embeddings(self, symbol_sources: List[str]) -> List[np.ndarray]:
+        """
+        Asynchronously get the embeddings for a batch of symbols in a single request.
+        The request is retried on rate limits and transient errors only, so that e.g. an invalid
+        input fails at once and can be retried on its own by the caller.
+        Args:
+            symbol_sources (List[str]): The source code of the symbols
+        Returns:
+            A list of numpy arrays representing the embeddings, in the order of the sources
+        """
+        if self._acreate_embedding_impl is None:
+            self._acreate_embedding_impl = openai.Embedding.acreate
+
+        # replace newlines, which can negatively affect performance.
+        inputs = [symbol_source.replace("\n", " ") for symbol_source in symbol_sources]
+        for attempt in range(1, EMBEDDING_REQUEST_ATTEMPTS + 1):
+            try:
+                response = await self._acreate_embedding_impl(
+                    input=inputs, engine="text-embedding-ada-002"
+                )
+                break
+            except _RETRYABLE_EMBEDDING_ERRORS as e:
+                if attempt == EMBEDDING_REQUEST_ATTEMPTS:
+                    raise
+                logger.debug("Embedding request failed with %s, retrying" % e)
+                await asyncio.sleep(random.uniform(0, min(EMBEDDING_RETRY_MAX_WAIT, 2**attempt)))
+
+        return [np.asarray(data["embedding"], dtype=np.float32) for data in response["data"]]
 
 
 class SymbolEmbeddingMap:
@@ -41,6 +132,9 @@ class SymbolEmbeddingMap:
         embedding_provider=None,
         build_new_embedding_map=False,
         load_embedding_map=False,
+        max_concurrent_requests=32,
+        embedding_batch_size=96,
+        max_cached_embeddings=4096,
         **kwargs,
     ):
         """
@@ -50,11 +144,21 @@ class SymbolEmbeddingMap:
             embedding_provider (EmbeddingsProvider): EmbeddingsProvider object
             build_new_embedding_map (bool): Whether to build a new embedding map
             load_embedding_map (bool): Whether to load an existing embedding map
+            max_concurrent_requests (int): Maximum number of embedding requests in flight at once
+            embedding_batch_size (int): Maximum number of symbols embedded per request
+            max_cached_embeddings (int): Maximum number of embeddings kept by source hash,
+                to avoid re-embedding identical sources
             **kwargs: Arbitrary keyword arguments
         Result:
             An instance of SymbolEmbeddingMap
         """
         self.embedding_provider = embedding_provider or EmbeddingsProvider()
+        self.max_concurrent_requests = max_concurrent_requests
+        self.embedding_batch_size = embedding_batch_size
+        self.max_cached_embeddings = max_cached_embeddings
+        # LRU cache of normalized embeddings by the hash of their source,
+        # to avoid re-embedding identical sources
+        self._source_hash_to_vector: OrderedDict[bytes, np.ndarray] = OrderedDict()
 
         if build_new_embedding_map and load_embedding_map:
             raise ValueError("Cannot specify both build_new_embedding_map and load_embedding_map")
@@ -74,10 +178,20 @@ class SymbolEmbeddingMap:
                     self.embedding_dict = SymbolEmbeddingMap.load(kwargs["embedding_path"])
                 # Otherwise, load the embedding map from the kwargs
                 elif "embedding_dict" in kwargs:
-                    self.embedding_dict = kwargs["embedding_dict"]
+                    self.embedding_dict = {
+                        symbol: replace(
+                            symbol_embedding,
+                            vector=SymbolEmbeddingMap._normalize_vector(symbol_embedding.vector),
+                        )
+                        for symbol, symbol_embedding in kwargs["embedding_dict"].items()
+                    }
             except KeyError as e:
                 raise ValueError(f"Missing required argument: {e}")
 
+            # Embeddings of the loaded symbols can be reused for new symbols with the same source
+            for symbol_embedding in self.embedding_dict.values():
+                self._cache_vector(symbol_embedding.source_hash, symbol_embedding.vector)
+
     def get_embedding_dict(self) -> Dict[Symbol, SymbolEmbedding]:
         """
         Get the embedding map.
@@ -88,14 +202,14 @@ class SymbolEmbeddingMap:
         """
         return self.embedding_dict
 
-    def update_embeddings(self, symbols_to_update: List[Symbol]):
+    def update_embeddings(self, symbols_to_update: List[Symbol]) -> List[Symbol]:
         """
         Update the embedding map with new symbols.
 
         Args:
             symbols_to_update (List[Symbol]): List of symbols to update
-        Result:
-            None
+        Returns:
+            List of symbols whose embedding was added, modified or renamed
         """
         from automata.core.search.symbol_utils import convert_to_fst_object  # for mocking
 
@@ -104,39 +218,58 @@ class SymbolEmbeddingMap:
             for symbol in self.embedding_dict.keys()
         }
 
+        # Collect the symbols which require a new embedding with their source and its hash,
+        # then fetch them concurrently
+        symbol_sources: Dict[Symbol, Tuple[str, bytes]] = {}
+        updated_symbols: List[Symbol] = []
         for symbol in symbols_to_update:
             try:
                 symbol_source = str(convert_to_fst_object(symbol))
                 symbol_desc_identifier = ".".join([desc.name for desc in symbol.descriptors])
                 map_symbol = desc_to_full_symbol.get(symbol_desc_identifier, None)
+                source_hash = SymbolEmbedding.hash_source(symbol_source)
 
                 if not map_symbol:
                     logger.debug("Adding a new symbol: %s" % symbol)
-                    symbol_embedding = self.embedding_provider.get_embedding(symbol_source)
-                    self.embedding_dict[symbol] = SymbolEmbedding(
-                        symbol=symbol, vector=symbol_embedding, source_code=symbol_source
-                    )
+                    symbol_sources[symbol] = (symbol_source, source_hash)
                 elif map_symbol:
                     # If the symbol is already in the embedding map, check if the source code is the same
-                    # If not, we can update the embedding
-                    if self.embedding_dict[map_symbol].source_code != symbol_source:
+                    # by comparing its hash. If not, we can update the embedding
+                    if self.embedding_dict[map_symbol].source_hash != source_hash:
                         logger.debug("Modifying existing embedding for symbol: %s" % symbol)
-                        symbol_embedding = self.embedding_provider.get_embedding(symbol_source)
-                        self.embedding_dict[symbol] = SymbolEmbedding(
-                            symbol=symbol, vector=symbol_embedding, source_code=symbol_source
-                        )
+                        symbol_sources[symbol] = (symbol_source, source_hash)
                     # If source code is the same, we can just update the symbol
                     elif map_symbol != symbol:
                         symbol_embedding = deepcopy(self.embedding_dict[map_symbol])
                         symbol_embedding.symbol = symbol
                         self.embedding_dict[symbol] = symbol_embedding
                         del self.embedding_dict[map_symbol]
+                        updated_symbols.append(symbol)
                     # Otherwise, we don't need to do anything
                     else:
                         pass
             except Exception as e:
-                if "test" not in symbol.uri and "local" not in symbol.uri:
-                    logger.error("Updating embedding for symbol: %s failed with %s" % (symbol, e))
+                self._log_update_failure(symbol, e)
+
+        symbol_embeddings = self._get_embeddings(
+            [symbol_source for symbol_source, _ in symbol_sources.values()],
+            [source_hash for _, source_hash in symbol_sources.values()],
+        )
+        for (symbol, (symbol_source, _)), (source_hash, symbol_embedding) in zip(
+            symbol_sources.items(), symbol_embeddings
+        ):
+            if isinstance(symbol_embedding, BaseException):
+                self._log_update_failure(symbol, symbol_embedding)
+                continue
+            self.embedding_dict[symbol] = SymbolEmbedding(
+                symbol=symbol,
+                vector=symbol_embedding,
+                source_code=symbol_source,
+                source_hash=source_hash,
+            )
+            updated_symbols.append(symbol)
+
+        return updated_symbols
 
     def filter_embedding_map(self, selected_symbols: List[Symbol]):
         """
@@ -156,23 +289,70 @@ class SymbolEmbeddingMap:
     def save(self, output_embedding_path: StrPath, overwrite: bool = False) -> None:
         """
         Save the built embedding map to a file.
+        The symbols and their source code are written as a JSON manifest to output_embedding_path,
+        while the embedding vectors are written as a single (N, D) float32 array to a sibling .npy file.
+        If output_embedding_path ends in .pkl, the manifest is instead pickled with protocol 5 and
+        the vectors are written out-of-band as raw bytes to a sibling .buffers file.
         Args:
             output_embedding_path (StrPath): Path to output file
             overwrite (bool): Whether to overwrite the file if it already exists
         Result:
             None
         """
+        vectors_path = SymbolEmbeddingMap._get_vectors_path(output_embedding_path)
         # Raise error if the file already exists
-        if os.path.exists(output_embedding_path) and not overwrite:
+        if (
+            os.path.exists(output_embedding_path) or os.path.exists(vectors_path)
+        ) and not overwrite:
             raise ValueError("output_embedding_path must be a path to a non-existing file.")
-        with open(output_embedding_path, "w") as f:
-            encoded_embedding = jsonpickle.encode(self.embedding_dict)
-            f.write(encoded_embedding)
+
+        symbol_embeddings = list(self.embedding_dict.values())
+        manifest = {
+            "symbols": [symbol_embedding.symbol.uri for symbol_embedding in symbol_embeddings],
+            "source_code": [
+                symbol_embedding.source_code for symbol_embedding in symbol_embeddings
+            ],
+            "source_hash": [
+                symbol_embedding.source_hash.hex() for symbol_embedding in symbol_embeddings
+            ],
+        }
+        vectors = np.ascontiguousarray(
+            (
+                np.stack([symbol_embedding.vector for symbol_embedding in symbol_embeddings])
+                if symbol_embeddings
+                else np.empty((0, 0))
+            ),
+            dtype=np.float32,
+        )
+
+        if SymbolEmbeddingMap._is_pickle_path(output_embedding_path):
+            # The vectors are handed to buffer_callback rather than copied into the pickle stream,
+            # and are written to the sidecar file straight from their memory
+            buffers: List[pickle.PickleBuffer] = []
+            manifest_bytes = pickle.dumps(
+                {**manifest, "vectors": vectors}, protocol=5, buffer_callback=buffers.append
+            )
+
+            def write_buffers(f: BinaryIO) -> None:
+                for buffer in buffers:
+                    f.write(buffer.raw())
+
+            SymbolEmbeddingMap._replace_file(vectors_path, write_buffers)
+            SymbolEmbeddingMap._replace_file(
+                output_embedding_path, lambda f: f.write(manifest_bytes)
+            )
+            return
+
+        manifest_bytes = orjson.dumps(manifest) if _USE_ORJSON else json.dumps(manifest).encode()
+        SymbolEmbeddingMap._replace_file(vectors_path, lambda f: np.save(f, vectors))
+        SymbolEmbeddingMap._replace_file(output_embedding_path, lambda f: f.write(manifest_bytes))
 
     @classmethod
     def load(cls, input_embedding_path: StrPath) -> Dict[Symbol, SymbolEmbedding]:
         """
         Load a saved embedding map from a local file.
+        The embedding vectors are memory-mapped from the sibling .npy (or, for .pkl files,
+        .buffers) file, so they are only paged in from disk when accessed.
         Args:
             input_embedding_path (StrPath): Path to input file
         """
@@ -180,15 +360,143 @@ class SymbolEmbeddingMap:
         if not os.path.exists(input_embedding_path):
             raise ValueError("input_embedding_path must be a path to an existing file.")
 
+        vectors_path = SymbolEmbeddingMap._get_vectors_path(input_embedding_path)
+        if SymbolEmbeddingMap._is_pickle_path(input_embedding_path):
+            return SymbolEmbeddingMap._load_pickle(input_embedding_path, vectors_path)
+        # Embedding maps saved before the .npy format are a single jsonpickle file
+        if not os.path.exists(vectors_path):
+            return SymbolEmbeddingMap._load_jsonpickle(input_embedding_path)
+
+        with open(input_embedding_path, "rb") as f:
+            manifest_bytes = f.read()
+            manifest = orjson.loads(manifest_bytes) if _USE_ORJSON else json.loads(manifest_bytes)
+        vectors = np.load(vectors_path, mmap_mode="r")
+        return SymbolEmbeddingMap._from_manifest(input_embedding_path, manifest, vectors)
+
+    @staticmethod
+    def _load_pickle(
+        input_embedding_path: StrPath, vectors_path: StrPath
+    ) -> Dict[Symbol, SymbolEmbedding]:
+        """
+        Load an embedding map pickled with protocol 5, whose vectors are read from
+        the out-of-band buffers file at vectors_path.
+        Args:
+            input_embedding_path (StrPath): Path to input file
+            vectors_path (StrPath): Path to the out-of-band buffers file
+        """
+        with open(vectors_path, "rb") as f:
+            # mmap cannot map an empty file, which is what an empty embedding map writes
+            vectors_buffer = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if os.fstat(f.fileno()).st_size
+                else b""
+            )
+        with open(input_embedding_path, "rb") as f:
+            # The unpickled vectors are a read-only view of the mapped file rather than a copy
+            manifest = pickle.load(f, buffers=[vectors_buffer])
+        return SymbolEmbeddingMap._from_manifest(
+            input_embedding_path, manifest, manifest.pop("vectors")
+        )
+
+    @staticmethod
+    def _from_manifest(
+        input_embedding_path: StrPath, manifest: Dict[str, List[str]], vectors: np.ndarray
+    ) -> Dict[Symbol, SymbolEmbedding]:
+        """
+        Build an embedding map from a saved manifest and the (N, D) array of its vectors.
+        Args:
+            input_embedding_path (StrPath): Path of the file the manifest was loaded from
+            manifest (Dict[str, List[str]]): The symbols, source code and source hashes
+            vectors (np.ndarray): The embedding vectors, in the order of the manifest symbols
+        """
+        if len(manifest["symbols"]) != len(vectors):
+            raise ValueError(
+                f"Embedding map {input_embedding_path} has {len(manifest['symbols'])} symbols"
+                f" but {len(vectors)} vectors."
+            )
+
+        embedding_dict = {}
+        for i, (symbol_uri, source_code, source_hash) in enumerate(
+            zip(manifest["symbols"], manifest["source_code"], manifest["source_hash"])
+        ):
+            symbol = parse_symbol(symbol_uri)
+            embedding_dict[symbol] = SymbolEmbedding(
+                symbol=symbol,
+                vector=vectors[i],
+                source_code=source_code,
+                source_hash=bytes.fromhex(source_hash),
+            )
+
+        return embedding_dict
+
+    @staticmethod
+    def _load_jsonpickle(input_embedding_path: StrPath) -> Dict[Symbol, SymbolEmbedding]:
+        """
+        Load an embedding map saved as a single jsonpickle file.
+        Args:
+            input_embedding_path (StrPath): Path to input file
+        """
         embedding_dict = {}
         with open(input_embedding_path, "r") as f:
             embedding_map_str_keys = jsonpickle.decode(f.read())
             embedding_dict = {
-                Symbol.from_string(key): value for key, value in embedding_map_str_keys.items()
+                Symbol.from_string(key): replace(
+                    value, vector=SymbolEmbeddingMap._normalize_vector(value.vector)
+                )
+                for key, value in embedding_map_str_keys.items()
             }
 
         return embedding_dict
 
+    @staticmethod
+    def _normalize_vector(vector: np.ndarray) -> np.ndarray:
+        """
+        L2-normalize an embedding vector to unit length, so that the cosine similarity
+        of two stored embeddings reduces to their dot product.
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm != 0 else vector
+
+    @staticmethod
+    def _replace_file(path: StrPath, write_file: Callable[[BinaryIO], Any]) -> None:
+        """
+        Write a file to a temporary file in the same directory, which then replaces it.
+        Embedding maps loaded from the previous file memory-map its vectors, so the file must
+        be replaced rather than truncated and rewritten in place, which would change their
+        vectors under them or crash the process on access to pages past the new end of the file.
+        Args:
+            path (StrPath): Path of the file to write
+            write_file (Callable[[BinaryIO], Any]): Writes the contents of the file
+        """
+        directory, file_name = os.path.split(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{file_name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write_file(f)
+            # mkstemp creates the file readable by its owner only, so apply the usual permissions
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_path, 0o666 & ~umask)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def _is_pickle_path(embedding_path: StrPath) -> bool:
+        """Returns whether the embedding map at the given path is saved as a pickle."""
+        return os.path.splitext(embedding_path)[1] == ".pkl"
+
+    @staticmethod
+    def _get_vectors_path(embedding_path: StrPath) -> str:
+        """
+        Returns the path of the .npy (or, for pickled embedding maps, .buffers) file
+        which holds the vectors of the embedding map.
+        """
+        root, ext = os.path.splitext(embedding_path)
+        return root + (".buffers" if ext == ".pkl" else ".npy")
+
     def _build_embedding_map(self, defined_symbols: List[Symbol]) -> Dict[Symbol, SymbolEmbedding]:
         """
         Build a map from symbol to embedding vector.
@@ -202,15 +510,145 @@ class SymbolEmbeddingMap:
         embedding_dict: Dict[Symbol, SymbolEmbedding] = {}
         filtered_symbols = get_rankable_symbols(defined_symbols)
 
+        symbol_sources: Dict[Symbol, str] = {}
         for symbol in filtered_symbols:
             try:
-                symbol_source = str(convert_to_fst_object(symbol))
-                symbol_embedding = self.embedding_provider.get_embedding(symbol_source)
-                embedding_dict[symbol] = SymbolEmbedding(
-                    symbol=symbol, vector=symbol_embedding, source_code=symbol_source
-                )
-
+                symbol_sources[symbol] = str(convert_to_fst_object(symbol))
             except Exception as e:
                 logger.error("Building embedding for symbol: %s failed with %s" % (symbol, e))
 
+        symbol_embeddings = self._get_embeddings(list(symbol_sources.values()))
+        for (symbol, symbol_source), (source_hash, symbol_embedding) in zip(
+            symbol_sources.items(), symbol_embeddings
+        ):
+            if isinstance(symbol_embedding, BaseException):
+                logger.error(
+                    "Building embedding for symbol: %s failed with %s" % (symbol, symbol_embedding)
+                )
+                continue
+            embedding_dict[symbol] = SymbolEmbedding(
+                symbol=symbol,
+                vector=symbol_embedding,
+                source_code=symbol_source,
+                source_hash=source_hash,
+            )
+
         return embedding_dict
+
+    def _get_embeddings(
+        self, symbol_sources: List[str], source_hashes: Optional[List[bytes]] = None
+    ) -> List[Tuple[bytes, Union[np.ndarray, BaseException]]]:
+        """
+        Get the normalized embeddings for a list of symbol sources, issuing batched requests
+        concurrently. Sources are deduplicated by their hash, so that identical sources
+        (e.g. re-exported symbols) are embedded once, and sources still in the cache of recently
+        embedded sources are not requested again.
+        Args:
+            symbol_sources: List of symbol source code to embed
+            source_hashes: The hashes of the sources, if already computed by the caller
+        Returns:
+            List of source hashes and embeddings in the same order as the sources,
+            where a failed request is represented by the exception it raised
+        """
+        if source_hashes is None:
+            source_hashes = [SymbolEmbedding.hash_source(source) for source in symbol_sources]
+
+        # The vectors of this call are collected separately from the cache,
+        # as the cache may evict them before they are returned
+        vectors: Dict[bytes, np.ndarray] = {}
+        missing_sources: Dict[bytes, str] = {}
+        for source_hash, symbol_source in zip(source_hashes, symbol_sources):
+            if source_hash in vectors or source_hash in missing_sources:
+                continue
+            if source_hash in self._source_hash_to_vector:
+                self._source_hash_to_vector.move_to_end(source_hash)
+                vectors[source_hash] = self._source_hash_to_vector[source_hash]
+            else:
+                missing_sources[source_hash] = symbol_source
+
+        failures: Dict[bytes, BaseException] = {}
+        if missing_sources:
+            embeddings = self._run_coroutine(self._aget_embeddings(list(missing_sources.values())))
+            for source_hash, embedding in zip(missing_sources.keys(), embeddings):
+                if isinstance(embedding, BaseException):
+                    failures[source_hash] = embedding
+                else:
+                    vectors[source_hash] = self._normalize_vector(embedding)
+                    self._cache_vector(source_hash, vectors[source_hash])
+
+        return [
+            (
+                source_hash,
+                failures[source_hash] if source_hash in failures else vectors[source_hash],
+            )
+            for source_hash in source_hashes
+        ]
+
+    def _cache_vector(self, source_hash: bytes, vector: np.ndarray) -> None:
+        """Cache the vector of a source, evicting the least recently used vectors beyond capacity."""
+        self._source_hash_to_vector[source_hash] = vector
+        self._source_hash_to_vector.move_to_end(source_hash)
+        while len(self._source_hash_to_vector) > self.max_cached_embeddings:
+            self._source_hash_to_vector.popitem(last=False)
+
+    @staticmethod
+    def _run_coroutine(coroutine: Coroutine[Any, Any, T]) -> T:
+        """
+        Run a coroutine to completion from synchronous code.
+        asyncio.run cannot be called from a thread with a running event loop (e.g. from an
+        async caller or a notebook), in which case the coroutine is run on a worker thread.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coroutine).result()
+
+    async def _aget_embeddings(
+        self, symbol_sources: List[str]
+    ) -> List[Union[np.ndarray, BaseException]]:
+        """
+        Gather the embeddings for a list of symbol sources in batches of at most
+        embedding_batch_size, with at most max_concurrent_requests requests in flight at once.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+
+        async def _aget_embedding(symbol_source: str) -> np.ndarray:
+            async with semaphore:
+                return await self.embedding_provider.aget_embedding(symbol_source)
+
+        async def _aget_batch_embeddings(
+            batch_sources: List[str],
+        ) -> List[Union[np.ndarray, BaseException]]:
+            async with semaphore:
+                try:
+                    return list(await self.embedding_provider.aget_embeddings(batch_sources))
+                except Exception as e:
+                    logger.debug("Batch embedding request failed with %s, retrying per symbol" % e)
+            # Fall back to one request per symbol so that a single bad input does not fail the batch
+            return await asyncio.gather(
+                *[_aget_embedding(symbol_source) for symbol_source in batch_sources],
+                return_exceptions=True,
+            )
+
+        # Sort the sources by length so that each batch holds sources of similar size
+        sorted_indices = sorted(range(len(symbol_sources)), key=lambda i: len(symbol_sources[i]))
+        batches = [
+            sorted_indices[i : i + self.embedding_batch_size]
+            for i in range(0, len(sorted_indices), self.embedding_batch_size)
+        ]
+        batch_embeddings = await asyncio.gather(
+            *[_aget_batch_embeddings([symbol_sources[i] for i in batch]) for batch in batches]
+        )
+
+        # Restore the original order of the sources
+        embeddings: Dict[int, Union[np.ndarray, BaseException]] = {}
+        for batch, batch_embedding in zip(batches, batch_embeddings):
+            embeddings.update(zip(batch, batch_embedding))
+        return [embeddings[i] for i in range(len(symbol_sources))]
+
+    @staticmethod
+    def _log_update_failure(symbol: Symbol, e: BaseException) -> None:
+        if "test" not in symbol.uri and "local" not in symbol.uri:
+            logger.error("Updating embedding for symbol: %s failed with %s" % (symbol, e))
@@ -1,7 +1,6 @@
 import logging
-from copy import deepcopy
 from enum import Enum
-from typing import Dict, Optional
+from typing import Dict, List, Literal, Optional, Tuple
 
 import numpy as np
 
@@ -13,6 +12,18 @@ from automata.core.search.symbol_types import Symbol, SymbolEmbedding
 
 logger = logging.getLogger(__name__)
 
+try:
+    import simsimd
+
+    _USE_SIMSIMD = True
+except ImportError:
+    _USE_SIMSIMD = False
+
+# Above this fraction of changed symbols, cached similarity matrices are recomputed in full
+MAX_INCREMENTAL_UPDATE_FRACTION = 0.3
+# Number of rows of the similarity matrix computed at once when only the nearest symbols are needed
+NEAREST_SYMBOLS_BLOCK_SIZE = 512
+
 
 class NormType(Enum):
     L1 = "l1"
@@ -25,22 +36,74 @@ class SymbolSimilarity:
         self,
         symbol_embedding_map: SymbolEmbeddingMap,
         norm_type: NormType = NormType.L2,
+        use_simsimd: bool = False,
     ):
         """
         Initialize SymbolSimilarity
         Args:
             symbol_embedding_map (SymbolSimilarity): SymbolSimilarity object
+            norm_type (NormType): The default normalization type
+            use_simsimd (bool): Whether to compute L2 (cosine) similarity matrices with SimSIMD
+                rather than the BLAS product, if SimSIMD is installed
         Result:
             An instance of SymbolSimilarity
         """
-        self.embedding_dict: Dict[Symbol, SymbolEmbedding] = deepcopy(
+        # The embedding map replaces rather than mutates its SymbolEmbeddings, so a shallow copy
+        # insulates this instance from updates to the map
+        self.embedding_dict: Dict[Symbol, SymbolEmbedding] = dict(
             symbol_embedding_map.get_embedding_dict()
         )
         self.embedding_provider: EmbeddingsProvider = symbol_embedding_map.embedding_provider
         self.default_norm_type = norm_type
-        symbols = sorted(list(self.embedding_dict.keys()), key=lambda x: x.uri)
-        self.index_to_symbol = {i: symbol for i, symbol in enumerate(symbols)}
-        self.symbol_to_index = {symbol: i for i, symbol in enumerate(symbols)}
+        self.use_simsimd = use_simsimd
+        self._similarity_matrices: Dict[NormType, np.ndarray] = {}
+        self._index_symbols()
+
+    def update_embeddings(
+        self, symbol_embedding_map: SymbolEmbeddingMap, updated_symbols: List[Symbol]
+    ) -> None:
+        """
+        Synchronize with an embedding map whose embeddings changed for the updated symbols,
+        e.g. the symbols returned by SymbolEmbeddingMap.update_embeddings.
+        When few embeddings changed, the cached similarity matrices are updated in place by
+        recomputing only the affected rows and columns, otherwise they are recomputed on demand.
+
+        Args:
+            symbol_embedding_map (SymbolEmbeddingMap): The updated SymbolEmbeddingMap
+            updated_symbols (List[Symbol]): The symbols whose embedding changed
+        Result:
+            None
+        """
+        embedding_dict = symbol_embedding_map.get_embedding_dict()
+
+        # If symbols were added, removed or renamed, the symbol indices change as well
+        if embedding_dict.keys() != self.embedding_dict.keys():
+            self.embedding_dict = dict(embedding_dict)
+            self._index_symbols()
+            return
+
+        updated_indices = sorted({self.symbol_to_index[symbol] for symbol in updated_symbols})
+        for index in updated_indices:
+            symbol = self.index_to_symbol[index]
+            self.embedding_dict[symbol] = embedding_dict[symbol]
+            self._embeddings[index] = embedding_dict[symbol].vector
+
+        if not updated_indices or not self._similarity_matrices:
+            return
+        if len(updated_indices) > MAX_INCREMENTAL_UPDATE_FRACTION * len(self.index_to_symbol):
+            self._similarity_matrices = {}
+            return
+
+        embeddings = self._embeddings
+        for norm_type, similarity_matrix in self._similarity_matrices.items():
+            embeddings_norm = (
+                embeddings
+                if norm_type == NormType.L2
+                else self._normalize_embeddings(embeddings, norm_type)
+            )
+            updated_rows = embeddings_norm[updated_indices] @ embeddings_norm.T
+            similarity_matrix[updated_indices, :] = updated_rows
+            similarity_matrix[:, updated_indices] = updated_rows.T
 
     def transform_similarity_matrix(
         self, S: np.ndarray, query_text: str, norm_type: Optional[str] = None
@@ -78,15 +141,22 @@ class SymbolSimilarity:
     def generate_similarity_matrix(self, norm_type: Optional[str] = None) -> np.ndarray:
         """
         Generate a similarity matrix for all symbols in the embedding map.
+        The matrix is cached and kept up to date by update_embeddings, so a read-only view of it
+        is returned, and callers that need to modify it must copy it first.
 
         Returns:
-            A 2D numpy array representing the similarity matrix
+            A read-only 2D numpy array representing the similarity matrix
         """
-        embeddings = self._get_ordered_embeddings()
+        processed_norm_type = self._process_norm_type(norm_type)
+        if processed_norm_type not in self._similarity_matrices:
+            self._similarity_matrices[processed_norm_type] = (
+                self._calculate_ordered_similarity_matrix(processed_norm_type)
+            )
 
-        return SymbolSimilarity._calculate_similarity_matrix(
-            embeddings, self._process_norm_type(norm_type)
-        )
+        # The cached matrix itself stays writable for the in-place updates of update_embeddings
+        similarity_matrix_view = self._similarity_matrices[processed_norm_type].view()
+        similarity_matrix_view.flags.writeable = False
+        return similarity_matrix_view
 
     def get_query_similarity_dict(
         self, query_text: str, norm_type: Optional[str] = None
@@ -136,16 +206,85 @@ class SymbolSimilarity:
             for index in reversed(nearest_indices)
         }
 
+    def get_nearest_symbols(
+        self,
+        k: int = 10,
+        norm_type: Optional[str] = None,
+        block_size: int = NEAREST_SYMBOLS_BLOCK_SIZE,
+    ) -> Dict[Symbol, Dict[Symbol, float]]:
+        """
+        Get the k most similar other symbols for every symbol in the embedding map.
+        The similarity matrix is computed block_size rows at a time and reduced to the top k
+        of each row, so the full N x N matrix is never materialized.
+        Args:
+            k (int): The number of similar symbols to return per symbol
+            block_size (int): The number of rows of the similarity matrix computed at once
+        Returns:
+            A dictionary mapping each symbol to a dictionary of its k most similar symbols
+            and their similarity scores, in order of decreasing similarity
+        """
+        processed_norm_type = self._process_norm_type(norm_type)
+        embeddings = self._get_ordered_embeddings()
+        embeddings_norm = (
+            embeddings
+            if processed_norm_type == NormType.L2
+            else self._normalize_embeddings(embeddings, processed_norm_type)
+        )
+
+        nearest_indices, nearest_scores = SymbolSimilarity._calculate_nearest_neighbors(
+            np.ascontiguousarray(embeddings_norm), k, block_size
+        )
+
+        return {
+            self.index_to_symbol[i]: {
+                self.index_to_symbol[index]: score
+                for index, score in zip(nearest_indices[i], nearest_scores[i])
+            }
+            for i in range(len(self.index_to_symbol))
+        }
+
+    def _index_symbols(self) -> None:
+        """
+        Index the symbols of the embedding map in order of their uri, stack their embeddings
+        into a single contiguous matrix and drop the cached similarity matrices.
+        """
+        symbols = sorted(list(self.embedding_dict.keys()), key=lambda x: x.uri)
+        self.index_to_symbol = {i: symbol for i, symbol in enumerate(symbols)}
+        self.symbol_to_index = {symbol: i for i, symbol in enumerate(symbols)}
+        # The embeddings are copied even when they are rows of a memory-mapped embedding map,
+        # as the rows of the map are read-only, in the order of the saved file rather than by uri,
+        # and no longer contiguous once the map is filtered or updated, while update_embeddings
+        # writes into this matrix in place
+        self._embeddings = (
+            np.stack([self.embedding_dict[symbol].vector for symbol in symbols]).astype(
+                np.float32, copy=False
+            )
+            if symbols
+            else np.empty((0, 0), dtype=np.float32)
+        )
+        self._similarity_matrices = {}
+
+    def _calculate_ordered_similarity_matrix(self, norm_type: NormType) -> np.ndarray:
+        """
+        Calculate the similarity matrix of the ordered embeddings.
+
+        Returns:
+            A 2D numpy array representing the similarity matrix
+        """
+        embeddings = self._get_ordered_embeddings()
+
+        return SymbolSimilarity._calculate_similarity_matrix(
+            embeddings, norm_type, normalized=True, use_simsimd=self.use_simsimd
+        )
+
     def _get_ordered_embeddings(self) -> np.ndarray:
         """
         Get the embeddings in the correct order.
 
         Returns:
-            A numpy array containing the ordered embeddings.
+            A contiguous (N, D) float32 numpy array containing the ordered embeddings.
         """
-        return np.array(
-            [self.embedding_dict[symbol].vector for symbol in self.index_to_symbol.values()]
-        )
+        return self._embeddings
 
     def _generate_unit_normed_query_vector(
         self, query_text: str, norm_type: NormType
@@ -184,8 +323,13 @@ class SymbolSimilarity:
         """
         embeddings = self._get_ordered_embeddings()
 
-        # Normalize the embeddings and the query embedding
-        embeddings_norm = self._normalize_embeddings(embeddings, norm_type)
+        # Normalize the embeddings and the query embedding,
+        # the symbol embeddings are already stored with a unit L2 norm
+        embeddings_norm = (
+            embeddings
+            if norm_type == NormType.L2
+            else self._normalize_embeddings(embeddings, norm_type)
+        )
         query_embedding_norm = self._normalize_embeddings(
             query_embedding[np.newaxis, :], norm_type
         )[0]
@@ -199,23 +343,115 @@ class SymbolSimilarity:
         return NormType(norm_type) if norm_type else self.default_norm_type
 
     @staticmethod
-    def _calculate_similarity_matrix(embeddings: np.ndarray, norm_type: NormType) -> np.ndarray:
+    def _calculate_similarity_matrix(
+        embeddings: np.ndarray,
+        norm_type: NormType,
+        normalized: bool = False,
+        use_simsimd: bool = False,
+    ) -> np.ndarray:
         """
         Calculate the similarity matrix for a list of embeddings.
         Args:
             embeddings (np.ndarray): A list of embeddings
             norm_type (str): The type of normalization ('l2' for L2 norm, 'softmax' for softmax)
+            normalized (bool): Whether the embeddings already have a unit L2 norm,
+                in which case the L2 similarity is their plain dot product
+            use_simsimd (bool): Whether to compute the L2 similarity with SimSIMD, if installed.
+                The BLAS product below is several times faster for the full N x N matrix
         Returns:
-            A 2D numpy array representing the similarity matrix
+            A 2D numpy array representing the similarity matrix, float32 unless the
+                embeddings are float64
         """
-        # Normalize the embeddings
-        embeddings_norm = SymbolSimilarity._normalize_embeddings(embeddings, norm_type)
+        if norm_type == NormType.L2 and use_simsimd and _USE_SIMSIMD:
+            # The dot product of L2-normed embeddings is the cosine similarity,
+            # which SimSIMD computes directly with SIMD kernels
+            embeddings = np.ascontiguousarray(
+                embeddings, dtype=np.result_type(embeddings.dtype, np.float32)
+            )
+            # Passing the same buffer as both operands lets SimSIMD compute only one triangle
+            # of the symmetric result and mirror it. Unless the embeddings are float64, the result
+            # is requested in float32, which halves the N x N allocation compared to SimSIMD's
+            # float64 default
+            out_dtype: Literal["float32", "float64"] = (
+                "float64" if embeddings.dtype == np.float64 else "float32"
+            )
+            if normalized:
+                return np.asarray(
+                    simsimd.cdist(embeddings, embeddings, metric="dot", out_dtype=out_dtype)
+                )
+            similarity_matrix = np.asarray(
+                simsimd.cdist(embeddings, embeddings, metric="cosine", out_dtype=out_dtype)
+            )
+            # Convert the cosine distances to similarities in place rather than into a second
+            # N x N array
+            np.subtract(1.0, similarity_matrix, out=similarity_matrix)
+            return similarity_matrix
+
+        # Normalize the embeddings into a C-contiguous buffer, so the product below is BLAS-eligible
+        embeddings_norm = np.ascontiguousarray(
+            embeddings
+            if norm_type == NormType.L2 and normalized
+            else SymbolSimilarity._normalize_embeddings(embeddings, norm_type)
+        )
 
-        # Compute the dot product between every pair of normalized embeddings
-        similarity_matrix = np.dot(embeddings_norm, embeddings_norm.T)
+        # Compute the dot product between every pair of normalized embeddings. Multiplying a buffer
+        # by its own transpose dispatches to BLAS syrk, which computes only one triangle of the
+        # symmetric result and mirrors it. The product is written into a single preallocated
+        # buffer of the embeddings' dtype, which is float32 for embedding maps
+        num_embeddings = embeddings_norm.shape[0]
+        similarity_matrix = np.empty((num_embeddings, num_embeddings), dtype=embeddings_norm.dtype)
+        np.matmul(embeddings_norm, embeddings_norm.T, out=similarity_matrix)
 
         return similarity_matrix
 
+    @staticmethod
+    def _calculate_nearest_neighbors(
+        embeddings_norm: np.ndarray, k: int, block_size: int = NEAREST_SYMBOLS_BLOCK_SIZE
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Calculate the k nearest neighbors of every embedding by their dot product, excluding
+        the embedding itself, one block of block_size rows of the similarity matrix at a time.
+        Args:
+            embeddings_norm (np.ndarray): The normalized embeddings
+            k (int): The number of neighbors, capped at the number of other embeddings
+            block_size (int): The number of rows of the similarity matrix computed at once
+        Returns:
+            A tuple of the (N, k) int32 neighbor indices and their (N, k) similarity scores,
+            each row in order of decreasing similarity
+        """
+        num_embeddings = embeddings_norm.shape[0]
+        k = max(min(k, num_embeddings - 1), 0)
+        nearest_indices = np.empty((num_embeddings, k), dtype=np.int32)
+        nearest_scores = np.empty((num_embeddings, k), dtype=embeddings_norm.dtype)
+        if k == 0:
+            return nearest_indices, nearest_scores
+
+        # A single (block_size, N) buffer is reused for every block, which bounds the peak memory
+        # of the similarity scores to O(block_size * N) instead of the O(N^2) of the full matrix
+        block_buffer = np.empty(
+            (min(block_size, num_embeddings), num_embeddings), dtype=embeddings_norm.dtype
+        )
+        for start in range(0, num_embeddings, block_size):
+            stop = min(start + block_size, num_embeddings)
+            block = block_buffer[: stop - start]
+            np.matmul(embeddings_norm[start:stop], embeddings_norm.T, out=block)
+            # Negate the scores in place, so the top k are the k smallest entries
+            # without allocating a negated copy of the block
+            np.negative(block, out=block)
+
+            # Exclude each embedding from its own neighbors
+            block_rows = np.arange(stop - start)
+            block[block_rows, block_rows + start] = np.inf
+
+            # Select the top k of each row in linear time, then sort only those k
+            block_indices = np.argpartition(block, k - 1, axis=1)[:, :k]
+            negated_block_scores = np.take_along_axis(block, block_indices, axis=1)
+            order = np.argsort(negated_block_scores, axis=1)
+            nearest_indices[start:stop] = np.take_along_axis(block_indices, order, axis=1)
+            nearest_scores[start:stop] = -np.take_along_axis(negated_block_scores, order, axis=1)
+
+        return nearest_indices, nearest_scores
+
     @staticmethod
     def _normalize_embeddings(embeddings: np.ndarray, norm_type: NormType) -> np.ndarray:
         """
@@ -230,7 +466,9 @@ class SymbolSimilarity:
             norm = np.sum(np.abs(embeddings), axis=1, keepdims=True)
             return embeddings / norm
         elif norm_type == NormType.L2:
-            return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+            # Clip the norm to avoid division by zero for degenerate (all-zero) embeddings
+            norm = np.linalg.norm(embeddings, axis=1, keepdims=True).clip(min=1e-12)
+            return embeddings / norm
         elif norm_type == NormType.SOFTMAX:
             e_x = np.exp(embeddings - np.max(embeddings, axis=1, keepdims=True))
             return e_x / np.sum(e_x, axis=1, keepdims=True)
@@ -1,6 +1,6 @@
 import os
 import random
-from unittest.mock import Mock
+from unittest.mock import AsyncMock, Mock
 
 import numpy as np
 import pytest
@@ -14,8 +14,9 @@ def temp_output_filename():
     this_dir = os.path.dirname(os.path.abspath(__file__))
     filename = os.path.join(this_dir, "test_output.json")
     yield filename
-    if os.path.exists(filename):
-        os.remove(filename)
+    for output_filename in (filename, os.path.splitext(filename)[0] + ".npy"):
+        if os.path.exists(output_filename):
+            os.remove(output_filename)
 
 
 @pytest.fixture
@@ -36,10 +37,13 @@ def mock_simple_class_symbols():
     return [parse_symbol(prefix + str(random.random()) + "_uri_ex_method#") for _ in range(100)]
 
 
-def get_sem(monkeypatch, mock_symbols, build_new_embedding_map=False):
-    monkeypatch.setattr(
-        "automata.core.search.symbol_utils.convert_to_fst_object", lambda args: "symbol_source"
-    )
+def get_sem(
+    monkeypatch,
+    mock_symbols,
+    build_new_embedding_map=False,
+    get_source=lambda args: "symbol_source",
+):
+    monkeypatch.setattr("automata.core.search.symbol_utils.convert_to_fst_object", get_source)
     return SymbolEmbeddingMap(
         # Symbols with kind 'Method' are processed, 'Local' are skipped
         all_defined_symbols=mock_symbols,
@@ -51,3 +55,8 @@ def patch_get_embedding(monkeypatch, mock_embedding):
     # Define the behavior of the mock get_embedding function
     mock_get_embedding = Mock(return_value=mock_embedding)
     monkeypatch.setattr("openai.embeddings_utils.get_embedding", mock_get_embedding)
+    mock_acreate_embedding = AsyncMock(
+        side_effect=lambda input, **kwargs: {"data": [{"embedding": mock_embedding}] * len(input)}
+    )
+    monkeypatch.setattr("openai.Embedding.acreate", mock_acreate_embedding)
+    return mock_acreate_embedding
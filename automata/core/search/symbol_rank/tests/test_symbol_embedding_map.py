@@ -1,8 +1,19 @@
-from unittest.mock import Mock
+import asyncio
+from unittest.mock import AsyncMock, Mock
 
+import jsonpickle
+import numpy as np
+import openai
+import pytest
 from conftest import get_sem, patch_get_embedding
 
-from automata.core.search.symbol_rank.symbol_embedding_map import SymbolEmbeddingMap
+from automata.core.search.symbol_parser import parse_symbol
+from automata.core.search.symbol_rank.symbol_embedding_map import (
+    EmbeddingsProvider,
+    SymbolEmbeddingMap,
+)
+from automata.core.search.symbol_rank.symbol_similarity import SymbolSimilarity
+from automata.core.search.symbol_types import SymbolEmbedding
 
 
 def test_build_embedding_map(
@@ -24,6 +35,11 @@ def test_build_embedding_map(
     assert len(embedding_dict) == 200
     for _, symbol_embedding in embedding_dict.items():
         assert symbol_embedding.vector.all() == mock_embedding.all()
+        # Embeddings are stored with a unit L2 norm
+        assert np.isclose(np.linalg.norm(symbol_embedding.vector), 1.0)
+        assert np.allclose(
+            symbol_embedding.vector, mock_embedding / np.linalg.norm(mock_embedding), atol=1e-6
+        )
 
 
 def test_save_load_embedding_map(
@@ -41,6 +57,82 @@ def test_save_load_embedding_map(
     sem_load = SymbolEmbeddingMap.load(temp_output_filename)
     for key, val in sem_load.items():
         assert key.uri in [symbol.uri for symbol in sem.embedding_dict.keys()]
+        assert np.allclose(val.vector, sem.embedding_dict[key].vector)
+        assert val.source_code == sem.embedding_dict[key].source_code
+
+
+def test_save_load_embedding_map_without_orjson(
+    monkeypatch,
+    mock_embedding,
+    temp_output_filename,
+    mock_simple_method_symbols,
+):
+    monkeypatch.setattr("automata.core.search.symbol_rank.symbol_embedding_map._USE_ORJSON", False)
+    patch_get_embedding(monkeypatch, mock_embedding)
+    sem = get_sem(monkeypatch, mock_simple_method_symbols[0:10], build_new_embedding_map=True)
+    sem.save(temp_output_filename)
+    sem_load = SymbolEmbeddingMap.load(temp_output_filename)
+    assert set(sem_load.keys()) == set(sem.embedding_dict.keys())
+
+
+def test_save_load_pickled_embedding_map(
+    monkeypatch,
+    mock_embedding,
+    tmp_path,
+    mock_simple_method_symbols,
+):
+    patch_get_embedding(monkeypatch, mock_embedding)
+    sem = get_sem(monkeypatch, mock_simple_method_symbols[0:10], build_new_embedding_map=True)
+    output_filename = tmp_path / "test_output.pkl"
+    sem.save(output_filename)
+    assert (tmp_path / "test_output.buffers").exists()
+    sem_load = SymbolEmbeddingMap.load(output_filename)
+    assert set(sem_load.keys()) == set(sem.embedding_dict.keys())
+    for key, val in sem_load.items():
+        assert np.allclose(val.vector, sem.embedding_dict[key].vector)
+        assert val.source_code == sem.embedding_dict[key].source_code
+        assert val.source_hash == sem.embedding_dict[key].source_hash
+
+
+@pytest.mark.parametrize("file_name", ["test_output.json", "test_output.pkl"])
+def test_save_over_loaded_embedding_map(tmp_path, mock_simple_method_symbols, file_name):
+    np.random.seed(0)
+    symbols = mock_simple_method_symbols[0:50]
+    embedding_dict = {
+        symbol: SymbolEmbedding(symbol=symbol, vector=np.random.randn(64), source_code=symbol.uri)
+        for symbol in symbols
+    }
+    embedding_path = tmp_path / file_name
+    SymbolEmbeddingMap(load_embedding_map=True, embedding_dict=embedding_dict).save(embedding_path)
+
+    # Saving a filtered map over the file it was loaded from must not change its loaded vectors
+    sem = SymbolEmbeddingMap(load_embedding_map=True, embedding_path=embedding_path)
+    sem.filter_embedding_map(symbols[1::10])
+    expected_vectors = {
+        symbol: np.array(symbol_embedding.vector)
+        for symbol, symbol_embedding in sem.embedding_dict.items()
+    }
+    sem.save(embedding_path, overwrite=True)
+
+    for symbol, symbol_embedding in sem.embedding_dict.items():
+        assert np.array_equal(symbol_embedding.vector, expected_vectors[symbol])
+    assert SymbolSimilarity(sem).generate_similarity_matrix().shape == (5, 5)
+    assert SymbolEmbeddingMap.load(embedding_path).keys() == set(symbols[1::10])
+
+
+def test_load_jsonpickle_embedding_map(
+    monkeypatch,
+    mock_embedding,
+    temp_output_filename,
+    mock_simple_method_symbols,
+):
+    patch_get_embedding(monkeypatch, mock_embedding)
+    sem = get_sem(monkeypatch, mock_simple_method_symbols[0:10], build_new_embedding_map=True)
+    # Write the embedding map in the legacy single-file jsonpickle format
+    with open(temp_output_filename, "w") as f:
+        f.write(jsonpickle.encode(sem.embedding_dict))
+    sem_load = SymbolEmbeddingMap.load(temp_output_filename)
+    assert set(sem_load.keys()) == set(sem.embedding_dict.keys())
 
 
 def test_get_embedding_sets_correct_result(
@@ -63,6 +155,19 @@ def test_get_embedding_sets_correct_result(
         assert val.source_code == "symbol_source"
 
 
+def test_embeddings_provider_binds_get_embedding_once(monkeypatch, mock_embedding):
+    patch_get_embedding(monkeypatch, mock_embedding)
+    provider = EmbeddingsProvider()
+    provider.get_embedding("symbol_source")
+    get_embedding_impl = provider._get_embedding_impl
+
+    # Later calls reuse the function bound on the first call
+    monkeypatch.setattr("openai.embeddings_utils.get_embedding", Mock())
+    provider.get_embedding("symbol_source")
+    assert provider._get_embedding_impl is get_embedding_impl
+    assert get_embedding_impl.call_count == 2
+
+
 def test_update_embeddings(
     monkeypatch,
     mock_embedding,
@@ -78,7 +183,10 @@ def test_update_embeddings(
 
     # Update embeddings for half of the symbols
     symbols_to_update = mock_symbols[: len(mock_symbols) // 2]
-    sem.update_embeddings(symbols_to_update)
+    updated_symbols = sem.update_embeddings(symbols_to_update)
+
+    # The source code is unchanged, so no embedding needs updating
+    assert updated_symbols == []
 
     # Verify the results
     for symbol in symbols_to_update:
@@ -96,5 +204,210 @@ def test_get_embedding_exception(monkeypatch, mock_simple_method_symbols):
     # Test exception in get_embedding function
     mock_get_embedding = Mock(side_effect=Exception("Test exception"))
     monkeypatch.setattr("openai.embeddings_utils.get_embedding", mock_get_embedding)
+    mock_acreate_embedding = AsyncMock(side_effect=Exception("Test exception"))
+    monkeypatch.setattr("openai.Embedding.acreate", mock_acreate_embedding)
     sem = get_sem(monkeypatch, mock_simple_method_symbols, build_new_embedding_map=True)
     assert len(sem.embedding_dict) == 0  # Expect empty embedding map because of exception
+
+
+def test_get_embedding_partial_exception(monkeypatch, mock_embedding, mock_simple_method_symbols):
+    # Test that a single failed input does not abort the remaining inputs of its batch
+    # The batch request fails, then the first per-symbol request fails as well
+    mock_acreate_embedding = AsyncMock(
+        side_effect=[Exception("Test exception")] * 2
+        + [{"data": [{"embedding": mock_embedding}]}] * 9
+    )
+    monkeypatch.setattr("openai.Embedding.acreate", mock_acreate_embedding)
+    sem = get_sem(
+        monkeypatch,
+        mock_simple_method_symbols[0:10],
+        build_new_embedding_map=True,
+        get_source=lambda symbol: symbol.uri,
+    )
+    assert len(sem.embedding_dict) == 9
+
+
+def test_invalid_batch_request_falls_back_without_retrying(
+    monkeypatch, mock_embedding, mock_simple_method_symbols
+):
+    # A batch holding an invalid input fails at once and falls back to per-symbol requests,
+    # where only the invalid input fails, also without being retried
+    def acreate_embedding(input, **kwargs):
+        if "invalid" in input:
+            raise openai.error.InvalidRequestError("Invalid input", param="input")
+        return {"data": [{"embedding": mock_embedding}] * len(input)}
+
+    mock_acreate_embedding = AsyncMock(side_effect=acreate_embedding)
+    monkeypatch.setattr("openai.Embedding.acreate", mock_acreate_embedding)
+    mock_sleep = AsyncMock()
+    monkeypatch.setattr("asyncio.sleep", mock_sleep)
+    symbols = mock_simple_method_symbols[0:10]
+    sem = get_sem(
+        monkeypatch,
+        symbols,
+        build_new_embedding_map=True,
+        get_source=lambda symbol: "invalid" if symbol == symbols[0] else symbol.uri,
+    )
+    assert len(sem.embedding_dict) == 9
+    assert mock_acreate_embedding.call_count == 1 + 10
+    mock_sleep.assert_not_called()
+
+
+def test_rate_limited_request_is_retried(monkeypatch, mock_embedding):
+    mock_acreate_embedding = AsyncMock(
+        side_effect=[openai.error.RateLimitError("Rate limit")] * 2
+        + [{"data": [{"embedding": mock_embedding}]}]
+    )
+    monkeypatch.setattr("openai.Embedding.acreate", mock_acreate_embedding)
+    mock_sleep = AsyncMock()
+    monkeypatch.setattr("asyncio.sleep", mock_sleep)
+
+    embeddings = asyncio.run(EmbeddingsProvider().aget_embeddings(["symbol_source"]))
+    assert np.array_equal(embeddings[0], np.asarray(mock_embedding, dtype=np.float32))
+    assert mock_acreate_embedding.call_count == 3
+    assert mock_sleep.call_count == 2
+
+
+def test_build_embedding_map_batches_requests(
+    monkeypatch,
+    mock_embedding,
+    mock_simple_method_symbols,
+    mock_simple_class_symbols,
+):
+    mock_acreate_embedding = patch_get_embedding(monkeypatch, mock_embedding)
+    mock_symbols = mock_simple_method_symbols + mock_simple_class_symbols
+    sem = get_sem(
+        monkeypatch,
+        mock_symbols,
+        build_new_embedding_map=True,
+        get_source=lambda symbol: symbol.uri,
+    )
+
+    # 200 symbols are embedded in batches of at most 96
+    assert len(sem.embedding_dict) == 200
+    assert mock_acreate_embedding.call_count == 3
+    assert [len(call.kwargs["input"]) for call in mock_acreate_embedding.call_args_list] == [
+        96,
+        96,
+        8,
+    ]
+
+
+def test_build_embedding_map_in_running_event_loop(
+    monkeypatch,
+    mock_embedding,
+    mock_simple_method_symbols,
+):
+    patch_get_embedding(monkeypatch, mock_embedding)
+
+    # Building the map from an async caller must not call asyncio.run on the running loop
+    async def build_sem():
+        return get_sem(
+            monkeypatch,
+            mock_simple_method_symbols[0:10],
+            build_new_embedding_map=True,
+            get_source=lambda symbol: symbol.uri,
+        )
+
+    sem = asyncio.run(build_sem())
+    assert len(sem.embedding_dict) == 10
+
+
+def test_build_embedding_map_deduplicates_sources(
+    monkeypatch,
+    mock_embedding,
+    mock_simple_method_symbols,
+):
+    mock_acreate_embedding = patch_get_embedding(monkeypatch, mock_embedding)
+    # All symbols share the same source, which is only embedded once
+    sem = get_sem(monkeypatch, mock_simple_method_symbols, build_new_embedding_map=True)
+    assert len(sem.embedding_dict) == 100
+    assert mock_acreate_embedding.call_count == 1
+    assert mock_acreate_embedding.call_args.kwargs["input"] == ["symbol_source"]
+
+    # Sources embedded by a previous call are reused
+    new_symbol = parse_symbol(
+        mock_simple_method_symbols[0].uri.replace("_uri_ex_", "_new_uri_ex_")
+    )
+    assert sem.update_embeddings([new_symbol]) == [new_symbol]
+    assert mock_acreate_embedding.call_count == 1
+
+
+def test_source_hash_cache_is_bounded(monkeypatch, mock_embedding, mock_simple_method_symbols):
+    mock_acreate_embedding = patch_get_embedding(monkeypatch, mock_embedding)
+    monkeypatch.setattr(
+        "automata.core.search.symbol_utils.convert_to_fst_object", lambda symbol: symbol.uri
+    )
+    symbols = mock_simple_method_symbols[0:10]
+    sem = SymbolEmbeddingMap(
+        all_defined_symbols=symbols, build_new_embedding_map=True, max_cached_embeddings=4
+    )
+    assert len(sem.embedding_dict) == 10
+    assert len(sem._source_hash_to_vector) == 4
+
+    # The most recently embedded sources are still reused, evicted ones are requested again
+    sem._get_embeddings([symbols[-1].uri])
+    assert mock_acreate_embedding.call_count == 1
+    sem._get_embeddings([symbols[0].uri])
+    assert mock_acreate_embedding.call_count == 2
+    assert len(sem._source_hash_to_vector) == 4
+
+
+def test_update_embeddings_modified_source(
+    monkeypatch,
+    mock_embedding,
+    mock_simple_method_symbols,
+):
+    patch_get_embedding(monkeypatch, mock_embedding)
+    symbols = mock_simple_method_symbols[0:10]
+    sem = get_sem(monkeypatch, symbols, build_new_embedding_map=True)
+
+    # Changing the source code changes its hash, which triggers an update of the embedding
+    monkeypatch.setattr(
+        "automata.core.search.symbol_utils.convert_to_fst_object", lambda args: "new_source"
+    )
+    assert set(sem.update_embeddings(symbols)) == set(symbols)
+    for symbol in symbols:
+        assert sem.embedding_dict[symbol].source_code == "new_source"
+        assert sem.embedding_dict[symbol].source_hash == SymbolEmbedding.hash_source("new_source")
+
+
+def test_update_embeddings_hashes_each_source_once(
+    monkeypatch,
+    mock_embedding,
+    mock_simple_method_symbols,
+):
+    patch_get_embedding(monkeypatch, mock_embedding)
+    symbols = mock_simple_method_symbols[0:10]
+    sem = get_sem(monkeypatch, symbols, build_new_embedding_map=True)
+
+    hash_source = Mock(side_effect=SymbolEmbedding.hash_source)
+    monkeypatch.setattr(SymbolEmbedding, "hash_source", hash_source)
+    monkeypatch.setattr(
+        "automata.core.search.symbol_utils.convert_to_fst_object", lambda symbol: symbol.uri
+    )
+    assert set(sem.update_embeddings(symbols)) == set(symbols)
+    assert hash_source.call_count == len(symbols)
+
+
+def test_update_embeddings_repeated_symbol(
+    monkeypatch,
+    mock_embedding,
+    mock_simple_method_symbols,
+):
+    patch_get_embedding(monkeypatch, mock_embedding)
+    sem = get_sem(monkeypatch, mock_simple_method_symbols[0:10], build_new_embedding_map=True)
+
+    # A symbol repeated before another new symbol is embedded once, along with the other symbol
+    new_symbols = [
+        parse_symbol(symbol.uri.replace("_uri_ex_", "_new_uri_ex_"))
+        for symbol in mock_simple_method_symbols[10:12]
+    ]
+    monkeypatch.setattr(
+        "automata.core.search.symbol_utils.convert_to_fst_object", lambda symbol: symbol.uri
+    )
+    updated_symbols = sem.update_embeddings([new_symbols[0], new_symbols[0], new_symbols[1]])
+    assert updated_symbols == new_symbols
+    for symbol in new_symbols:
+        assert sem.embedding_dict[symbol].source_code == symbol.uri
+        assert sem.embedding_dict[symbol].source_hash == SymbolEmbedding.hash_source(symbol.uri)
@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 from conftest import get_sem, patch_get_embedding
 
 from automata.core.search.symbol_rank.symbol_embedding_map import (
@@ -30,7 +31,30 @@ def test_generate_similarity_matrix(
     )
 
 
-def test_calculate_similarity():
+def test_generate_similarity_matrix_read_only(mock_simple_method_symbols):
+    np.random.seed(0)
+    embedding_dict = {
+        symbol: SymbolEmbedding(symbol=symbol, vector=np.random.randn(64), source_code=symbol.uri)
+        for symbol in mock_simple_method_symbols[:10]
+    }
+    symbol_similarity = SymbolSimilarity(
+        SymbolEmbeddingMap(load_embedding_map=True, embedding_dict=embedding_dict)
+    )
+    similarity_matrix = symbol_similarity.generate_similarity_matrix()
+    expected_similarity_matrix = similarity_matrix.copy()
+
+    # In-place writes would corrupt the cached matrix, so they must fail
+    with pytest.raises(ValueError):
+        similarity_matrix /= 2
+    with pytest.raises(ValueError):
+        similarity_matrix[0, 0] = 0.0
+    assert np.array_equal(
+        symbol_similarity.generate_similarity_matrix(), expected_similarity_matrix
+    )
+
+
+def test_calculate_similarity(monkeypatch):
+    monkeypatch.setattr("automata.core.search.symbol_rank.symbol_similarity._USE_SIMSIMD", False)
     np.random.seed(0)
     matrix = np.random.rand(10, 10)
     distances = SymbolSimilarity._calculate_similarity_matrix(matrix, NormType.L2)
@@ -39,6 +63,143 @@ def test_calculate_similarity():
     assert distances[0][1] == 0.8642101667343082
 
 
+def test_calculate_similarity_normalized():
+    np.random.seed(0)
+    matrix = np.random.rand(10, 10).astype(np.float32)
+    matrix_norm = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+    distances = SymbolSimilarity._calculate_similarity_matrix(matrix, NormType.L2)
+    distances_norm = SymbolSimilarity._calculate_similarity_matrix(
+        matrix_norm, NormType.L2, normalized=True
+    )
+    assert np.allclose(distances, distances_norm, atol=1e-6)
+
+
+def test_calculate_similarity_symmetric():
+    np.random.seed(0)
+    matrix = np.asfortranarray(np.random.rand(50, 16))
+    for norm_type in NormType:
+        distances = SymbolSimilarity._calculate_similarity_matrix(matrix, norm_type)
+        assert np.allclose(distances, distances.T)
+
+
+def test_calculate_similarity_zero_embedding(monkeypatch):
+    monkeypatch.setattr("automata.core.search.symbol_rank.symbol_similarity._USE_SIMSIMD", False)
+    matrix = np.array([[1.0, 0.0], [0.0, 0.0]], dtype=np.float32)
+    distances = SymbolSimilarity._calculate_similarity_matrix(matrix, NormType.L2)
+    assert not np.isnan(distances).any()
+    assert distances[0][0] == 1.0
+    assert distances[1][1] == 0.0
+
+
+def test_calculate_similarity_simsimd():
+    pytest.importorskip("simsimd")
+    np.random.seed(0)
+    matrix = np.random.rand(10, 10)
+    distances = SymbolSimilarity._calculate_similarity_matrix(
+        matrix, NormType.L2, use_simsimd=True
+    )
+    expected = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+    assert np.allclose(distances, expected @ expected.T, atol=1e-6)
+
+
+@pytest.mark.parametrize("use_simsimd", [False, True])
+def test_calculate_similarity_float32(use_simsimd):
+    if use_simsimd:
+        pytest.importorskip("simsimd")
+    np.random.seed(0)
+    matrix = np.random.rand(10, 16).astype(np.float32)
+    for normalized in (False, True):
+        distances = SymbolSimilarity._calculate_similarity_matrix(
+            matrix, NormType.L2, normalized=normalized, use_simsimd=use_simsimd
+        )
+        assert distances.dtype == np.float32
+        assert distances.shape == (10, 10)
+
+
+def test_update_embeddings_similarity_matrix(mock_simple_method_symbols):
+    np.random.seed(0)
+    symbols = mock_simple_method_symbols[:10]
+    embedding_dict = {
+        symbol: SymbolEmbedding(symbol=symbol, vector=np.random.randn(64), source_code=symbol.uri)
+        for symbol in symbols
+    }
+    symbol_embedding_map = SymbolEmbeddingMap(
+        load_embedding_map=True, embedding_dict=embedding_dict
+    )
+    symbol_similarity = SymbolSimilarity(symbol_embedding_map)
+    symbol_similarity.generate_similarity_matrix()
+    symbol_similarity.generate_similarity_matrix(norm_type="softmax")
+
+    # Change the embedding of two symbols, which updates the cached matrices in place
+    updated_symbols = symbols[:2]
+    for symbol in updated_symbols:
+        symbol_embedding_map.embedding_dict[symbol] = SymbolEmbedding(
+            symbol=symbol,
+            vector=SymbolEmbeddingMap._normalize_vector(np.random.randn(64)),
+            source_code=symbol.uri,
+        )
+    symbol_similarity.update_embeddings(symbol_embedding_map, updated_symbols)
+
+    expected_similarity = SymbolSimilarity(symbol_embedding_map)
+    for norm_type in ("l2", "softmax"):
+        assert np.allclose(
+            symbol_similarity.generate_similarity_matrix(norm_type=norm_type),
+            expected_similarity.generate_similarity_matrix(norm_type=norm_type),
+            atol=1e-6,
+        )
+
+    # Adding a symbol re-indexes the symbols
+    new_symbol = mock_simple_method_symbols[10]
+    symbol_embedding_map.embedding_dict[new_symbol] = SymbolEmbedding(
+        symbol=new_symbol,
+        vector=SymbolEmbeddingMap._normalize_vector(np.random.randn(64)),
+        source_code=new_symbol.uri,
+    )
+    symbol_similarity.update_embeddings(symbol_embedding_map, [new_symbol])
+    assert new_symbol in symbol_similarity.symbol_to_index
+    assert symbol_similarity.generate_similarity_matrix().shape == (11, 11)
+
+
+def test_calculate_nearest_neighbors():
+    np.random.seed(0)
+    matrix = np.random.rand(50, 16).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    expected = matrix @ matrix.T
+    np.fill_diagonal(expected, -np.inf)
+    expected_indices = np.argsort(-expected, axis=1)[:, :5]
+
+    # A block size that does not divide the number of embeddings exercises the last partial block
+    indices, scores = SymbolSimilarity._calculate_nearest_neighbors(matrix, k=5, block_size=16)
+    assert indices.shape == scores.shape == (50, 5)
+    assert np.array_equal(indices, expected_indices)
+    assert np.allclose(scores, np.take_along_axis(expected, expected_indices, axis=1))
+
+
+def test_get_nearest_symbols(mock_simple_method_symbols):
+    np.random.seed(0)
+    symbols = mock_simple_method_symbols[:10]
+    embedding_dict = {
+        symbol: SymbolEmbedding(symbol=symbol, vector=np.random.randn(64), source_code=symbol.uri)
+        for symbol in symbols
+    }
+    symbol_similarity = SymbolSimilarity(
+        SymbolEmbeddingMap(load_embedding_map=True, embedding_dict=embedding_dict)
+    )
+    similarity_matrix = symbol_similarity.generate_similarity_matrix()
+
+    nearest_symbols = symbol_similarity.get_nearest_symbols(k=3, block_size=4)
+    assert nearest_symbols.keys() == set(symbols)
+    for symbol, neighbors in nearest_symbols.items():
+        assert len(neighbors) == 3
+        assert symbol not in neighbors
+        i = symbol_similarity.symbol_to_index[symbol]
+        for neighbor, score in neighbors.items():
+            assert np.isclose(
+                score, similarity_matrix[i, symbol_similarity.symbol_to_index[neighbor]]
+            )
+        assert list(neighbors.values()) == sorted(neighbors.values(), reverse=True)
+
+
 def test_get_nearest_symbols_for_query(monkeypatch, mock_simple_method_symbols):
     # Mocking symbols and their embeddings
     symbol1 = mock_simple_method_symbols[0]
@@ -1,3 +1,4 @@
+import hashlib
 import re
 from dataclasses import dataclass
 from enum import Enum
@@ -216,9 +217,21 @@ class SymbolReference:
 
 @dataclass
 class SymbolEmbedding:
+    """The vector of an embedding held by a SymbolEmbeddingMap is L2-normalized to unit length."""
+
     symbol: Symbol
     vector: np.ndarray
     source_code: str
+    source_hash: bytes = b""
+
+    def __post_init__(self):
+        if not self.source_hash:
+            self.source_hash = SymbolEmbedding.hash_source(self.source_code)
+
+    @staticmethod
+    def hash_source(source_code: str) -> bytes:
+        """Returns a short BLAKE2b digest of the source code of a symbol."""
+        return hashlib.blake2b(source_code.encode(), digest_size=16).digest()
 
 
 @dataclass
@@ -1,3 +1,4 @@
+import re
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import networkx as nx
@@ -74,25 +75,19 @@ def get_rankable_symbols(
         List of filtered symbols
     """
     filtered_symbols = []
+    # Scan each uri once for all filter strings, and check kinds and suffixes with set lookups
+    filter_uri = re.compile("|".join(re.escape(s) for s in filter_strings)).search
+    accepted_kinds_set = frozenset(accepted_kinds)
+    rejected_suffixes = frozenset(
+        (Descriptor.ScipSuffix.Local, Descriptor.ScipSuffix.Meta, Descriptor.ScipSuffix.Parameter)
+    )
 
     for symbol in symbols:
-        do_continue = False
-        for filter_string in filter_strings:
-            if filter_string in symbol.uri:
-                do_continue = True
-                break
-        if do_continue:
+        if filter_strings and filter_uri(symbol.uri):
             continue
-
-        symbol_kind = symbol.symbol_kind_by_suffix()
-        if symbol_kind not in accepted_kinds:
+        if symbol.symbol_kind_by_suffix() not in accepted_kinds_set:
             continue
-        if (
-            Symbol.is_protobuf(symbol)
-            or Symbol.is_local(symbol)
-            or Symbol.is_meta(symbol)
-            or Symbol.is_parameter(symbol)
-        ):
+        if Symbol.is_protobuf(symbol) or symbol.descriptors[0].suffix in rejected_suffixes:
             continue
 
         filtered_symbols.append(symbol)
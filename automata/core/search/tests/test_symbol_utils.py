@@ -0,0 +1,61 @@
+import pytest
+
+from automata.core.search.symbol_parser import parse_symbol
+from automata.core.search.symbol_utils import get_rankable_symbols
+
+prefix = "scip-python python automata 75482692a6fe30c72db516201a6f47d9fb4af065 "
+
+
+@pytest.mark.parametrize(
+    "uri, is_rankable",
+    [
+        # Methods and classes are rankable
+        ("`automata.core.mod`/MyClass#my_method().", True),
+        ("`automata.core.mod`/my_function().", True),
+        ("`automata.core.mod`/MyClass#", True),
+        # Other kinds are not
+        ("`automata.core.mod`/MyClass#my_attribute.", False),
+        ("`automata.core.mod`/", False),
+        ("local 1", False),
+        # Neither are symbols matching a filter string
+        ("`automata.core.setup`/MyClass#", False),
+        ("`automata.stdlib.mod`/my_function().", False),
+        # Nor protobuf, meta and parameter symbols
+        ("`automata.core.mod_pb2`/MyClass#", False),
+        ("meta:MyClass#", False),
+        ("(param)MyClass#my_method().", False),
+    ],
+)
+def test_get_rankable_symbols(uri, is_rankable):
+    symbol = parse_symbol(uri if uri.startswith("local") else prefix + uri)
+    assert get_rankable_symbols([symbol]) == ([symbol] if is_rankable else [])
+
+
+def test_get_rankable_symbols_preserves_order():
+    symbols = [
+        parse_symbol(prefix + uri)
+        for uri in [
+            "`automata.core.mod`/MyClass#",
+            "`automata.core.setup`/MyClass#",
+            "`automata.core.mod`/my_function().",
+            "`automata.core.mod`/MyClass#my_attribute.",
+        ]
+    ]
+    assert get_rankable_symbols(symbols) == [symbols[0], symbols[2]]
+
+
+def test_get_rankable_symbols_without_filter_strings():
+    symbols = [
+        parse_symbol(prefix + uri)
+        for uri in ["`automata.core.setup`/MyClass#", "`automata.stdlib.mod`/my_function()."]
+    ]
+    assert get_rankable_symbols(symbols, filter_strings=()) == symbols
+    assert get_rankable_symbols(symbols, filter_strings=("setup",)) == [symbols[1]]
+
+
+def test_get_rankable_symbols_accepted_kinds():
+    symbol = parse_symbol(prefix + "`automata.core.mod`/MyClass#my_attribute.")
+    assert get_rankable_symbols([symbol]) == []
+    assert get_rankable_symbols([symbol], accepted_kinds=(symbol.symbol_kind_by_suffix(),)) == [
+        symbol
+    ]
@@ -46,9 +46,7 @@ class PythonWriterToolManager(BaseToolManager):
         tools = [
             Tool(
                 name="python-writer-update-module",
-                func=lambda module_object_code_tuple: self._update_existing_module(
-                    *module_object_code_tuple
-                ),
+                func=self._func_update_existing_module,
                 description=f"Inserts or updates the python code of a function, class, method in an existing module"
                 f" If a given object or its child object do not exist,"
                 f" then they are created automatically. If the object already exists, then the existing code is modified."
@@ -68,9 +66,7 @@ class PythonWriterToolManager(BaseToolManager):
             ),
             Tool(
                 name="python-writer-create-new-module",
-                func=lambda module_object_code_tuple: self._create_new_module(
-                    *module_object_code_tuple
-                ),
+                func=self._func_create_new_module,
                 description=f"Creates a new module at the given path with the given code. For example:"
                 f" - tool_query_1\n"
                 f"   - tool_name\n"
@@ -82,9 +78,7 @@ class PythonWriterToolManager(BaseToolManager):
             ),
             Tool(
                 name="python-writer-delete-from-existing-module",
-                func=lambda module_object_code_tuple: self._delete_from_existing_module(
-                    *module_object_code_tuple
-                ),
+                func=self._func_delete_from_existing_module,
                 description=f"Deletes python objects and their code by name from existing module. For example:"
                 f" - tool_query_1\n"
                 f"   - tool_name\n"
@@ -132,3 +126,12 @@ class PythonWriterToolManager(BaseToolManager):
             return "Success"
         except Exception as e:
             return "Failed to create the module with error - " + str(e)
+
+    def _func_update_existing_module(self, module_object_code_tuple):
+        return self._update_existing_module(*module_object_code_tuple)
+
+    def _func_create_new_module(self, module_object_code_tuple):
+        return self._create_new_module(*module_object_code_tuple)
+
+    def _func_delete_from_existing_module(self, module_object_code_tuple):
+        return self._delete_from_existing_module(*module_object_code_tuple)
@@ -11,6 +11,10 @@ setup(
     version="0.1.0",
     packages=find_packages(),
     install_requires=read_requirements(),
+    extras_require={
+        # Optional accelerations, used when installed
+        "fast": ["orjson>=3.8.3", "simsimd>=6.0.0"],
+    },
     entry_points={
         "console_scripts": [
             # If you want to create command-line executables, you can define them here.